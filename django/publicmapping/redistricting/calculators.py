@@ -31,14 +31,18 @@ Author:
 from math import sqrt, pi
 from django.contrib.gis.geos import Point, LineString
 from django.contrib.humanize.templatetags.humanize import intcomma
-from django.utils import simplejson as json
+# Aliased privately so "from redistricting.calculators import *" does not
+# rebind the simplejson-based "json" name other modules import alongside
+# this one; simplejson serializes Decimals, the stdlib encoder does not.
+import json as _json
 from django.utils.translation import ugettext as _
 from django.template import Template, Context
 from decimal import Decimal
 from copy import copy
 import random
+import numpy
 
-from django.db.models import Q
+from django.db.models import Q, Sum as DbSum
 import operator
 import itertools
 import redis
@@ -46,30 +50,101 @@ from django.conf import settings
 from redisutils import key_gen
 redis_settings = settings.KEY_VALUE_STORE
 
+# Parsed Template objects, keyed by their source string. Rendering a
+# plan report evaluates the same handful of template literals once per
+# calculator cell; parsing each of them a single time leaves only the
+# render work in the per-cell path.
+_template_cache = {}
+
+def get_template(template):
+    """
+    Get a parsed django Template for a template string, parsing each
+    distinct string only once per process.
+
+    @param template: A string that may use django template tags.
+
+    @return: The parsed C{Template} object for the string.
+    """
+    t = _template_cache.get(template)
+    if t is None:
+        t = Template(template)
+        _template_cache[template] = t
+    return t
+
+
+def _json_default(value):
+    """
+    Coerce values the stdlib json encoder can't handle natively.
+    Subject values are Decimals, which are serialized as floats.
+
+    @param value: An unencodable value from a calculator result.
+
+    @return: A JSON-encodable representation of the value.
+    """
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError('%r is not JSON serializable' % value)
+
+
+# Lists shorter than this are summed with the generic python reduction;
+# packing them into an array costs more than it saves.
+_FAST_SUM_THRESHOLD = 64
+
+def _fast_sum(values):
+    """
+    Sum a list of numeric values.
+
+    Short or mixed-type lists are summed with the generic python
+    reduction. Long lists of plain numbers are packed into a float64
+    array and summed in a single numpy call, which avoids per-element
+    bytecode dispatch and number unboxing.
+
+    @param values: A list of numbers to sum.
+
+    @return: The sum of the values.
+    """
+    if len(values) > _FAST_SUM_THRESHOLD:
+        try:
+            arr = numpy.fromiter(values, numpy.float64, len(values))
+            return float(arr.sum())
+        except (TypeError, ValueError):
+            # Non-numeric content; fall through to the generic reduction
+            pass
+
+    return reduce(lambda x, y: x + y, values)
+
+
 class CalculatorBase(object):
     """
-    The base class for all calculators. CalculatorBase defines the result 
+    The base class for all calculators. CalculatorBase defines the result
     object and a couple default rendering options for HTML and JSON.
-    """
 
-    # This calculator's result
-    result = None
+    Calculators are instantiated once per (district, metric) pair when
+    scoring, so they carry slots instead of instance dicts; subclasses
+    declare any state of their own the same way.
+    """
 
-    # This calculator's dictionary of arguments. This dictionary is keyed
-    # by argument name, and the values are tuples of the type name and
-    # the value.
-    #
-    # E.g.: arg_dict = { 'minimum':('literal','0.5',) }
-    #
-    arg_dict = {}
+    __slots__ = ('result', 'arg_dict', '_subject_memo')
 
     def __init__(self):
         """
         Initialize the result and argument dictionary.
+
+        The argument dictionary is keyed by argument name, and the
+        values are tuples of the type name and the value.
+
+        E.g.: arg_dict = { 'minimum':('literal','0.5',) }
         """
         self.result = None
         self.arg_dict = {}
 
+        # Subject values resolved from the database by resolve_value,
+        # keyed by (district id, subject name). The memo lives only as
+        # long as this calculator instance -- one scoring pass -- so
+        # writes to ComputedCharacteristics made by other code, or by
+        # other processes, can never be served stale from here.
+        self._subject_memo = {}
+
     def compute(self, **kwargs):
         """
         Compute the value for this calculator. The base class calculates
@@ -130,7 +205,50 @@ class CalculatorBase(object):
         else:
             output = { 'result': None }
 
-        return json.dumps( output, use_decimal=True )
+        return _json.dumps( output, default=_json_default )
+
+    @classmethod
+    def html_batch(cls, results):
+        """
+        Generate HTML representations for a list of results.
+
+        One renderer instance is reused for all of the results, so
+        batch callers (such as plan report views) avoid constructing
+        and dispatching a calculator per rendered cell. Subclasses with
+        specialized html() methods are honored, since the renderer is
+        an instance of the calculator class itself.
+
+        @param results: A list of calculator results.
+
+        @return: A list of HTML strings, one per result.
+        """
+        renderer = cls()
+        output = []
+        for result in results:
+            renderer.result = result
+            output.append(renderer.html())
+
+        return output
+
+    @classmethod
+    def json_batch(cls, results):
+        """
+        Generate JSON representations for a list of results.
+
+        As with L{html_batch}, one renderer instance is reused for all
+        of the results.
+
+        @param results: A list of calculator results.
+
+        @return: A list of JSON strings, one per result.
+        """
+        renderer = cls()
+        output = []
+        for result in results:
+            renderer.result = result
+            output.append(renderer.json())
+
+        return output
 
     def template(self, template, context=None):
         """
@@ -145,7 +263,7 @@ class CalculatorBase(object):
 
         @return: A string representing the rendering template and context
         """
-        t = Template(template)
+        t = get_template(template)
         c = Context({'result': self.result})
         if context is not None:
             c.update(context)
@@ -159,28 +277,98 @@ class CalculatorBase(object):
         @return: A string representing the result as a percentage
         """
         if span:
-            t = Template('<span>{{ percentage|floatformat:2 }}%</span>')
+            t = get_template('<span>{{ percentage|floatformat:2 }}%</span>')
         else:
-            t = Template('{{ percentage|floatformat:2 }}%')
+            t = get_template('{{ percentage|floatformat:2 }}%')
         c = Context({'percentage': self.result['value'] * 100})
         return t.render(c)
 
-    def get_value(self, argument, district=None):
+    def get_computed_characteristics(self, districts):
+        """
+        Fetch the ComputedCharacteristics for a set of districts with a
+        single query.
+
+        Plan calculations ask L{get_value} for subject values once per
+        district per argument; resolving each of those from the database
+        individually generates a flood of small queries. This method
+        fetches all of the ComputedCharacteristics for the districts at
+        once, and arranges them in a dict suitable for passing to
+        L{get_value} as the C{cc_map} parameter.
+
+        The numbers are cast to double precision in the database, so
+        psycopg2 hands back native python floats; every consumer of
+        these values converts to float anyway, and skipping the
+        intermediate Decimal saves an allocation and a __float__ call
+        per value.
+
+        @param districts: A list of L{District}s whose
+            ComputedCharacteristics should be fetched.
+
+        @return: A dict, keyed by district id, of dicts that map subject
+            names to ComputedCharacteristic numbers, as floats.
+        """
+        # Imported here to avoid a circular import with redistricting.models
+        from redistricting.models import ComputedCharacteristic
+
+        cc_map = {}
+        ccs = ComputedCharacteristic.objects.filter(
+            district__in=districts).extra(
+            select={'number_f':
+                'CAST("redistricting_computedcharacteristic"."number" AS double precision)'}
+            ).values_list('district_id', 'subject__name', 'number_f')
+        for (district_id, name, number) in ccs:
+            cc_map.setdefault(district_id, {})[name] = number
+
+        return cc_map
+
+    def get_value_args(self, prefix='value'):
+        """
+        Collect a sequence of numbered arguments from the argument
+        dictionary.
+
+        The arguments are gathered starting at position 1, and ending
+        at the first missing position, mirroring the way the compute
+        methods traverse their "valueN" (or "minorityN", "boundN")
+        sequences. Parsing the sequence once per computation avoids
+        reformatting and rehashing the key strings for every district
+        in a plan, and each position costs a single dict get rather
+        than a membership test followed by an indexing.
+
+        @param prefix: Optional. The name the argument sequence is
+            numbered from; defaults to 'value'.
+
+        @return: An ordered list of (argtype, argval) tuples.
+        """
+        value_args = []
+        argnum = 1
+        entry = self.arg_dict.get('%s1' % prefix)
+        while not entry is None:
+            value_args.append(entry)
+            argnum += 1
+            entry = self.arg_dict.get('%s%d' % (prefix, argnum))
+
+        return value_args
+
+    def get_value(self, argument, district=None, cc_map=None):
         """
         Get the value of an argument if it is a literal or a subject.
 
         This method is used anytime a calculator needs to get the value of
-        a named argument. The type of the argument is determined from the 
+        a named argument. The type of the argument is determined from the
         tuple in the argument dictionary, and either the literal value or
         the retrieved ComputedCharacteristic is returned. This only searches
         for the ComputedCharacteristic in the set attached to the district.
 
-        If no district is provided, no subject argument value is ever 
+        If no district is provided, no subject argument value is ever
         returned.
 
         @param argument: The name of the argument passed to the calculator.
-        @param district: An optional district, used to fetch related 
+        @param district: An optional district, used to fetch related
             ComputedCharacteristics.
+        @param cc_map: Optional. A map of prefetched
+            ComputedCharacteristic numbers, as generated by
+            L{get_computed_characteristics}. When provided, subject
+            arguments are resolved from the map instead of the database.
 
         @return: The value of the subject or literal argument.
         """
@@ -189,6 +377,27 @@ class CalculatorBase(object):
         except:
             return None
 
+        return self.resolve_value(argtype, argval, district, cc_map)
+
+    def resolve_value(self, argtype, argval, district=None, cc_map=None):
+        """
+        Resolve an argument tuple to a literal or subject value.
+
+        This performs the value resolution for L{get_value}; callers
+        that have already parsed the argument dictionary (such as
+        L{get_value_args} consumers) can use it directly and skip the
+        name lookup.
+
+        @param argtype: The type of the argument: 'literal' or 'subject'.
+        @param argval: The value of the argument: a literal value, or
+            a subject name.
+        @param district: An optional district, used to fetch related
+            ComputedCharacteristics.
+        @param cc_map: Optional. A map of prefetched
+            ComputedCharacteristic numbers.
+
+        @return: The value of the subject or literal argument.
+        """
         value = None
         if argtype == 'literal':
             value = argval
@@ -202,76 +411,172 @@ class CalculatorBase(object):
                     # No problem, it may be a string
                     pass
         elif argtype == 'subject' and not district is None:
-            # This method is more fault tolerant than _set.get, since it 
-            # won't throw an exception if the item doesn't exist.
             add_subject = True
             if argval.startswith('-'):
                 add_subject = False
                 argval = argval[1:]
-            cc = district.computedcharacteristic_set.filter(subject__name=argval)
-            if cc.count() > 0:
-                value = cc[0].number if add_subject else -cc[0].number
+            if not cc_map is None:
+                number = cc_map.get(district.id, {}).get(argval)
+                if not number is None:
+                    value = number if add_subject else -number
+            else:
+                key = (district.id, argval)
+                if key in self._subject_memo:
+                    number = self._subject_memo[key]
+                else:
+                    # This method is more fault tolerant than _set.get,
+                    # since it won't throw an exception if the item doesn't
+                    # exist. The slice issues one LIMIT 1 query; count()
+                    # followed by indexing would issue two.
+                    cc = list(district.computedcharacteristic_set.filter(
+                        subject__name=argval).only('number')[:1])
+                    number = cc[0].number if len(cc) > 0 else None
+
+                    self._subject_memo[key] = number
+
+                if not number is None:
+                    value = number if add_subject else -number
         return value
 
 
+# The constant factor of the Schwartzberg formula:
+# 2*pi*sqrt(area/pi) / length reduces to 2*sqrt(pi*area) / length
+_TWO_SQRT_PI = 2.0 * sqrt(pi)
+
 class Schwartzberg(CalculatorBase):
     """
     Calculator for the Schwartzberg measure of compactness.
-        
-    The Schwartzberg measure of compactness measures the perimeter of 
-    the district to the circumference of the circle whose area is 
+
+    The Schwartzberg measure of compactness measures the perimeter of
+    the district to the circumference of the circle whose area is
     equal to the area of the district. The algorithm here computes the
-    inverse Schwartberg compactness measure, suitable for display as a 
-    percentage, with a higher percentage indicating a more compact 
+    inverse Schwartberg compactness measure, suitable for display as a
+    percentage, with a higher percentage indicating a more compact
     district.
 
     This calculator will calculate either the compactness score of a
-    single district, or it will average the compactness scores of all 
+    single district, or it will average the compactness scores of all
     districts in a plan.
     """
+
+    __slots__ = ()
+
+    @classmethod
+    def compute_batch(cls, districts):
+        """
+        Compute the Schwartzberg compactness score for a list of
+        districts.
+
+        Each district's area and boundary length are read only once;
+        every geometry property access crosses into GEOS, so repeated
+        reads during plan scoring are wasted work.
+
+        The areas and lengths are gathered into contiguous numpy arrays
+        so the arithmetic runs as a few C-level array operations rather
+        than one interpreted sqrt/multiply/divide per district.
+
+        @param districts: A list of L{District}s to score.
+
+        @return: A list of compactness scores, in district order, with
+            None for districts that cannot be scored (the unassigned
+            district, empty geometries, or zero-length boundaries).
+        """
+        indices = []
+        areas = []
+        lengths = []
+        for i, district in enumerate(districts):
+            if district.district_id == 0 or district.geom.empty:
+                continue
+
+            (area, length) = district.get_geom_metrics()
+            if length == 0:
+                continue
+
+            indices.append(i)
+            areas.append(area)
+            lengths.append(length)
+
+        scores = [None] * len(districts)
+        if len(indices) == 0:
+            return scores
+
+        areas = numpy.array(areas, dtype=numpy.float64)
+        lengths = numpy.array(lengths, dtype=numpy.float64)
+
+        # scores = 2*sqrt(pi*area)/length, computed in place
+        numpy.sqrt(areas, areas)
+        numpy.multiply(areas, _TWO_SQRT_PI, areas)
+        numpy.divide(areas, lengths, areas)
+
+        for n, i in enumerate(indices):
+            scores[i] = float(areas[n])
+
+        return scores
+
+    @classmethod
+    def compute_plan(cls, districts):
+        """
+        Compute the Schwartzberg compactness scores for a plan's
+        districts inside PostGIS.
+
+        The district geometries already live in the database, so
+        evaluating 2*sqrt(pi*area)/perimeter there returns one score
+        per district without materializing any geometry in python or
+        crossing into GEOS at all. Empty geometries produce a zero
+        perimeter, which NULLIF turns into a NULL score; those are
+        dropped, matching the batch path's skip rules.
+
+        @param districts: A list of L{District}s to score.
+
+        @return: A list of compactness scores for the scorable
+            districts.
+        """
+        # Imported here to avoid a circular import with redistricting.models
+        from redistricting.models import District
+
+        # A database error here is allowed to propagate: the plan
+        # districts are fetched without their geometries, so falling
+        # back to GEOS scoring would issue one deferred geometry query
+        # per district, and inside a transaction those retries would
+        # fail against the already-aborted transaction anyway.
+        rows = District.objects.filter(
+            pk__in=[d.id for d in districts],
+            district_id__gt=0).extra(
+            select={'compactness':
+                '2.0*sqrt(pi()*ST_Area(geom))/NULLIF(ST_Perimeter(geom),0)'}
+            ).values_list('compactness', flat=True)
+        return filter(lambda s: not s is None, list(rows))
+
     def compute(self, **kwargs):
         """
         Calculate the Schwartzberg measure of compactness.
 
-        @keyword district: A L{District} whose compactness should be 
+        @keyword district: A L{District} whose compactness should be
             computed.
-        @keyword plan: A L{Plan} whose district compactnesses should be 
+        @keyword plan: A L{Plan} whose district compactnesses should be
             averaged.
-        @keyword version: Optional. The version of the plan, defaults to 
+        @keyword version: Optional. The version of the plan, defaults to
             the most recent version.
         """
-        districts = []
         if 'district' in kwargs:
             districts = [kwargs['district']]
             if districts[0].geom.empty:
                 return
 
+            scores = filter(lambda s: not s is None, self.compute_batch(districts))
+
         elif 'plan' in kwargs:
             plan = kwargs['plan']
             version = kwargs['version'] if 'version' in kwargs else plan.version
-            districts = plan.get_districts_at_version(version, include_geom=True)
+            districts = plan.get_districts_at_version(version, include_geom=False)
+            scores = self.compute_plan(districts)
 
         else:
             return
 
-        num = 0
-        compactness = 0
-        for district in districts:
-            if district.district_id == 0:
-                continue
+        num = len(scores)
 
-            if district.geom.empty:
-                continue
-
-            if district.geom.length == 0:
-                continue
-        
-            r = sqrt(district.geom.area / pi)
-            circumference = 2 * pi * r
-            compactness += circumference / district.geom.length
-            num += 1
-
-        self.result = { 'value': (compactness / num) if num > 0 else 0 }
+        self.result = { 'value': (sum(scores) / num) if num > 0 else 0 }
 
 
     def html(self):
@@ -298,7 +603,8 @@ class Roeck(CalculatorBase):
     district, or it will average the compactness scores of all districts
     in a plan.
     """
-    rec = 0
+
+    __slots__ = ('rec',)
 
     def compute(self, **kwargs):
         """
@@ -581,6 +887,9 @@ class PolsbyPopper(CalculatorBase):
     district, or it will average the compactness scores of all districts
     in a plan.
     """
+
+    __slots__ = ()
+
     def compute(self, **kwargs):
         """
         Calculate the Polsby-Popper measure of compactness.
@@ -620,7 +929,8 @@ class PolsbyPopper(CalculatorBase):
                 for linestring in poly:
                     perimeter += linestring.length
 
-            compactness += 4 * pi * district.geom.area / perimeter / perimeter
+            (area, length) = district.get_geom_metrics()
+            compactness += 4 * pi * area / perimeter / perimeter
             num += 1
 
         self.result = { 'value': compactness / num }
@@ -650,6 +960,9 @@ class LengthWidthCompactness(CalculatorBase):
     district, or it will average the compactness scores of all districts
     in a plan.
     """
+
+    __slots__ = ()
+
     def compute(self, **kwargs):
         """
         Calculate the Length/Width measure of compactness.
@@ -729,6 +1042,8 @@ class SumValues(CalculatorBase):
     a plan summary
     """
 
+    __slots__ = ()
+
     def compute(self, **kwargs):
         """
         Calculate the sum of a series of values.
@@ -750,21 +1065,22 @@ class SumValues(CalculatorBase):
             districts = plan.get_districts_at_version(version, include_geom=False)
         elif 'list' in kwargs:
             lst = kwargs['list']
-            self.result = {'value': reduce(lambda x,y: x + y, lst)}
+            self.result = {'value': _fast_sum(lst)}
             return
         else:
             return
-        
-        sumvals = 0
 
-        for district in districts:
-            argnum = 1
-            while ('value%d'%argnum) in self.arg_dict:
-                number = self.get_value('value%d'%argnum, district)
-                if not number is None:
-                    sumvals += number
+        if 'plan' in kwargs:
+            sumvals = self._sum_plan(districts)
+        else:
+            value_args = self.get_value_args()
+            sumvals = 0
 
-                argnum += 1
+            for district in districts:
+                for (argtype, argval) in value_args:
+                    number = self.resolve_value(argtype, argval, district)
+                    if not number is None:
+                        sumvals += number
 
         if self.get_value('target') is not None:
             target = self.get_value('target')
@@ -772,6 +1088,67 @@ class SumValues(CalculatorBase):
         else:
             self.result = { 'value': sumvals }
 
+    def _sum_plan(self, districts):
+        """
+        Sum the value arguments across all the districts in a plan.
+
+        Subject arguments are totalled with a single aggregate query,
+        grouped by subject, so the summation arithmetic happens in the
+        database rather than district-by-district in python. Only literal
+        arguments are resolved in python.
+
+        @param districts: The list of L{District}s to sum across.
+
+        @return: The sum of all value arguments over the districts.
+        """
+        # Imported here to avoid a circular import with redistricting.models
+        from redistricting.models import ComputedCharacteristic
+
+        subject_args = []
+        literal_args = []
+        for (argtype, argval) in self.get_value_args():
+            if argtype == 'subject':
+                subject_args.append(argval)
+            else:
+                literal_args.append((argtype, argval))
+
+        sumvals = 0
+
+        if len(subject_args) > 0:
+            names = map(lambda n: n[1:] if n.startswith('-') else n, subject_args)
+            # order_by() clears the model's default ordering, which would
+            # otherwise leak into the GROUP BY of the aggregation.
+            totals = ComputedCharacteristic.objects.filter(
+                district__in=districts, subject__name__in=names).values(
+                'subject__name').annotate(total=DbSum('number')).order_by()
+            totals = dict((t['subject__name'], t['total']) for t in totals)
+
+            # Apply each subject argument separately, since the same
+            # subject may appear more than once, or negated.
+            for argval in subject_args:
+                if argval.startswith('-'):
+                    total = totals.get(argval[1:])
+                    if not total is None:
+                        sumvals -= total
+                else:
+                    total = totals.get(argval)
+                    if not total is None:
+                        sumvals += total
+
+        if len(literal_args) > 0:
+            # A literal contributes the same value for every district;
+            # resolve each one once and multiply by the district count
+            # instead of re-adding it district by district.
+            literal_sum = 0
+            for (argtype, argval) in literal_args:
+                number = self.resolve_value(argtype, argval)
+                if not number is None:
+                    literal_sum += number
+
+            sumvals += literal_sum * len(districts)
+
+        return sumvals
+
     def html(self):
         """
         Generate an HTML representation of the summation score. This
@@ -799,6 +1176,9 @@ class Percent(CalculatorBase):
     After the numerator and denominator values have been accumulated, 
     it computes the percentage of those totals.
     """
+
+    __slots__ = ()
+
     def compute(self, **kwargs):
         """
         Calculate a percentage.
@@ -822,22 +1202,39 @@ class Percent(CalculatorBase):
             plan = kwargs['plan']
             version = kwargs['version'] if 'version' in kwargs else plan.version
             districts = plan.get_districts_at_version(version, include_geom=False)
-            num = 0
-            den = 0
-            for district in districts:
-                if district.district_id == 0:
-                    continue
 
-                tmpnum = self.get_value('numerator',district)
-                tmpden = self.get_value('denominator',district)
+            num_arg = self.arg_dict.get('numerator')
+            den_arg = self.arg_dict.get('denominator')
+
+            if not num_arg is None and num_arg[0] == 'subject' and \
+                not den_arg is None and den_arg[0] == 'subject' and \
+                not num_arg[1].startswith('-') and \
+                not den_arg[1].startswith('-'):
+                # Common case: both arguments are plain subjects, so the
+                # totals can be accumulated by the database.
+                (num, den,) = self._percent_plan(districts, num_arg[1],
+                    den_arg[1])
+            else:
+                cc_map = self.get_computed_characteristics(districts)
+                num = 0
+                den = 0
+                for district in districts:
+                    if district.district_id == 0:
+                        continue
 
-                # If either the numerator or denominator don't exist,
-                # we have to skip it.
-                if tmpnum is None or tmpden is None:
-                    continue
+                    tmpnum = self.get_value('numerator',district,cc_map=cc_map)
+                    tmpden = self.get_value('denominator',district,cc_map=cc_map)
 
-                den += tmpden
-                num += tmpnum
+                    # If either the numerator or denominator don't exist,
+                    # we have to skip it.
+                    if tmpnum is None or tmpden is None:
+                        continue
+
+                    # Accumulate as floats; the prefetched subject values are
+                    # already floats, and mixing them with Decimal literals
+                    # is not valid arithmetic.
+                    den += float(tmpden)
+                    num += float(tmpnum)
 
         else:
             return
@@ -853,7 +1250,52 @@ class Percent(CalculatorBase):
                 self.result = { 'value': 0 }
             else:
                 self.result = { 'value': num / den['value'] }
-            
+
+    def _percent_plan(self, districts, num_name, den_name):
+        """
+        Accumulate the numerator and denominator totals for a plan with
+        a single grouped query.
+
+        Only the characteristics for the two subjects of interest are
+        read, and the grouping is performed by the database. As in the
+        general accumulation loop, the unassigned district and any
+        district that is missing either subject are skipped.
+
+        @param districts: The list of districts in the plan.
+        @param num_name: The name of the numerator subject.
+        @param den_name: The name of the denominator subject.
+        @return: A (numerator, denominator,) tuple of totals.
+        """
+        # Import here to avoid a circular dependency
+        from redistricting.models import ComputedCharacteristic
+
+        district_ids = [d.id for d in districts if d.district_id != 0]
+        # order_by() clears the model's default ordering, which would
+        # otherwise leak into the GROUP BY of the aggregation.
+        totals = ComputedCharacteristic.objects.filter(
+            district__in=district_ids,
+            subject__name__in=[num_name, den_name]).values(
+            'district', 'subject__name').annotate(
+            total=DbSum('number')).order_by()
+
+        nums = {}
+        dens = {}
+        for row in totals:
+            if row['subject__name'] == num_name:
+                nums[row['district']] = row['total']
+            if row['subject__name'] == den_name:
+                dens[row['district']] = row['total']
+
+        num = 0
+        den = 0
+        for district_id in nums:
+            if not district_id in dens:
+                continue
+
+            num += float(nums[district_id])
+            den += float(dens[district_id])
+
+        return (num, den,)
 
     def html(self):
         """
@@ -886,6 +1328,9 @@ class Threshold(CalculatorBase):
     If this calculator is called with a plan, it will tally up the number
     of districts that exceed the designated threshold.
     """
+
+    __slots__ = ()
+
     def compute(self, **kwargs):
         """
         Calculate and determine if a value exceeds a threshold.
@@ -898,6 +1343,7 @@ class Threshold(CalculatorBase):
             the most recent version.
         """
         districts = []
+        cc_map = None
 
         if 'district' in kwargs:
             districts = [kwargs['district']]
@@ -907,13 +1353,44 @@ class Threshold(CalculatorBase):
             version = kwargs['version'] if 'version' in kwargs else plan.version
             districts = plan.get_districts_at_version(version, include_geom=False)
 
+            val_arg = self.arg_dict.get('value')
+            thr_arg = self.arg_dict.get('threshold')
+
+            if not val_arg is None and not thr_arg is None and \
+                val_arg[0] == 'subject' and not val_arg[1].startswith('-'):
+                if thr_arg[0] == 'subject' and \
+                    not thr_arg[1].startswith('-'):
+                    # Both arguments are plain subjects; compare the
+                    # database-grouped totals in one pass.
+                    self.result = { 'value': self.count_exceeding(
+                        districts, val_arg[1], thr_arg[1]) }
+                    return
+
+                if thr_arg[0] == 'literal':
+                    threshold = self.resolve_value(thr_arg[0], thr_arg[1])
+                    if not threshold is None:
+                        # A literal threshold reduces the tally to a
+                        # single count query.
+
+                        # Import here to avoid a circular dependency
+                        from redistricting.models import ComputedCharacteristic
+
+                        count = ComputedCharacteristic.objects.filter(
+                            district__in=[d.id for d in districts],
+                            subject__name=val_arg[1],
+                            number__gt=threshold).count()
+                        self.result = { 'value': count }
+                        return
+
+            cc_map = self.get_computed_characteristics(districts)
+
         else:
             return
 
         count = 0
         for district in districts:
-            val = self.get_value('value',district)
-            thr = self.get_value('threshold',district)
+            val = self.get_value('value',district,cc_map=cc_map)
+            thr = self.get_value('threshold',district,cc_map=cc_map)
 
             if val is None or thr is None:
                 continue
@@ -923,6 +1400,53 @@ class Threshold(CalculatorBase):
 
         self.result = { 'value': count }
 
+    @classmethod
+    def count_exceeding(cls, districts, value_name, threshold_name):
+        """
+        Count the districts whose value subject exceeds their threshold
+        subject.
+
+        The characteristics for the two subjects are grouped per
+        district by the database, and the comparisons are made in one
+        pass over the grouped rows. Districts that are missing either
+        subject are not counted.
+
+        @param districts: The list of districts to tally.
+        @param value_name: The name of the subject to compare.
+        @param threshold_name: The name of the subject to compare
+            against.
+        @return: The number of districts whose value exceeds their
+            threshold.
+        """
+        # Import here to avoid a circular dependency
+        from redistricting.models import ComputedCharacteristic
+
+        # order_by() clears the model's default ordering, which would
+        # otherwise leak into the GROUP BY of the aggregation.
+        totals = ComputedCharacteristic.objects.filter(
+            district__in=[d.id for d in districts],
+            subject__name__in=[value_name, threshold_name]).values(
+            'district', 'subject__name').annotate(
+            total=DbSum('number')).order_by()
+
+        values = {}
+        thresholds = {}
+        for row in totals:
+            if row['subject__name'] == value_name:
+                values[row['district']] = row['total']
+            if row['subject__name'] == threshold_name:
+                thresholds[row['district']] = row['total']
+
+        count = 0
+        for district_id in values:
+            if not district_id in thresholds:
+                continue
+
+            if float(values[district_id]) > float(thresholds[district_id]):
+                count += 1
+
+        return count
+
 
 class Range(CalculatorBase):
     """
@@ -949,6 +1473,9 @@ class Range(CalculatorBase):
     population, this will count the number of districts within the target
     range.
     """
+
+    __slots__ = ()
+
     def compute(self, **kwargs):
         """
         Calculate and determine if a value lies within a range.
@@ -961,6 +1488,7 @@ class Range(CalculatorBase):
             the most recent version.
         """
         districts = None
+        cc_map = None
 
         if 'district' in kwargs:
             districts = [kwargs['district']]
@@ -969,6 +1497,7 @@ class Range(CalculatorBase):
             plan = kwargs['plan']
             version = kwargs['version'] if 'version' in kwargs else plan.version
             districts = plan.get_districts_at_version(version, include_geom=False)
+            cc_map = self.get_computed_characteristics(districts)
 
         else:
             return
@@ -980,22 +1509,22 @@ class Range(CalculatorBase):
         else:
             apply_num_members = False
 
-        for district in districts:            
+        for district in districts:
             if district.district_id == 0:
                 continue
 
-            val = self.get_value('value',district)
-                
+            val = self.get_value('value',district,cc_map=cc_map)
+
             if apply_num_members and district.num_members > 1:
                 val = float(val) / district.num_members
-            
-            minval = self.get_value('min',district)
-            maxval = self.get_value('max',district)
+
+            minval = self.get_value('min',district,cc_map=cc_map)
+            maxval = self.get_value('max',district,cc_map=cc_map)
 
             if val is None or minval is None or maxval is None:
                 continue
 
-            if float(val) > float(minval) and float(val) < float(maxval):
+            if float(minval) < float(val) < float(maxval):
                 count += 1
 
         self.result = { 'value': count }
@@ -1028,6 +1557,9 @@ class Contiguity(CalculatorBase):
     of districts that are contiguous.
 
     """
+
+    __slots__ = ()
+
     def compute(self, **kwargs):
         """
         Determine if a district is contiguous.
@@ -1157,6 +1689,9 @@ class AllContiguous(CalculatorBase):
 
     This calculator will only operate on a plan.
     """
+
+    __slots__ = ()
+
     def compute(self, **kwargs):
         """
         Compute the contiguity of all the districts in the plan.
@@ -1189,6 +1724,9 @@ class NonContiguous(CalculatorBase):
 
     This calculator will only operate on a plan.
     """
+
+    __slots__ = ()
+
     def compute(self, **kwargs):
         """
         Compute the number of districts in a plan that are non-contiguous.
@@ -1233,6 +1771,9 @@ class Interval(CalculatorBase):
     Given a plan, this calculator will return the number of districts that 
     fall in the interval including the target
     """
+
+    __slots__ = ()
+
     def compute(self, **kwargs):
         """
         Determine the interval to which a district's value belongs.
@@ -1256,13 +1797,10 @@ class Interval(CalculatorBase):
             districts = [kwargs['district']]
 
             # Set up our bounds
-            argnum = 1
-            while ('bound%d' % argnum) in self.arg_dict:
-                bound = Decimal(str(self.get_value('bound%d' % argnum)))
+            for (argtype, argval) in self.get_value_args(prefix='bound'):
+                bound = Decimal(str(self.resolve_value(argtype, argval)))
                 bounds.append(target + (target * bound))
                 bounds.append(target - (target * bound))
-                
-                argnum += 1
             bounds.sort()
         
             # Check which interval our subject's value is in
@@ -1294,13 +1832,11 @@ class Interval(CalculatorBase):
             districts = plan.get_districts_at_version(version, include_geom=True)
 
             # Set up our bounds
-            argnum = 1
             min_bound = None
-            while ('bound%d' % argnum) in self.arg_dict:
-                bound = Decimal(str(self.get_value('bound%d' % argnum)))
+            for (argtype, argval) in self.get_value_args(prefix='bound'):
+                bound = Decimal(str(self.resolve_value(argtype, argval)))
                 if (not min_bound) or (bound < min_bound):
                     min_bound = bound
-                argnum += 1
 
             max_bound = target + (target * min_bound)
             min_bound = target - (target * min_bound)
@@ -1360,6 +1896,9 @@ class Equivalence(CalculatorBase):
     of members assigned to each district when performing calculations.
     This should only be used with population subjects.
     """
+
+    __slots__ = ()
+
     def compute(self, **kwargs):
         """
         Generate an equivalence score.
@@ -1433,6 +1972,9 @@ class RepresentationalFairness(CalculatorBase):
     and the second item is the party toward which the plan's 
     districts are biased
     """
+
+    __slots__ = ()
+
     def compute(self, **kwargs):
         """
         Compute the representational fairness.
@@ -1506,7 +2048,7 @@ class RepresentationalFairness(CalculatorBase):
         else:
             output = {'result': None}
 
-        return json.dumps(output)
+        return _json.dumps(output)
 
     def sortkey(self):
         """
@@ -1539,6 +2081,9 @@ class Competitiveness(CalculatorBase):
     This calculator requires three arguments: 'democratic', 'republican',
         and 'range'
     """
+
+    __slots__ = ()
+
     def compute(self, **kwargs):
         """
         Compute the competitiveness.
@@ -1600,6 +2145,9 @@ class CountDistricts(CalculatorBase):
     districts desired in a plan.  If the number of districts matches
     the target value, a boolean True is the result.
     """
+
+    __slots__ = ()
+
     def compute(self, **kwargs):
         """
         Compute the number of districts in a plan.
@@ -1633,6 +2181,9 @@ class AllBlocksAssigned(CalculatorBase):
     This calculator has an optional argument of 'threshold', which is used
     for buffer in/out optimization.
     """
+
+    __slots__ = ()
+
     def compute(self, **kwargs):
         """
         Determine if all the blocks in the plan are assigned to a district.
@@ -1671,6 +2222,9 @@ class Equipopulation(CalculatorBase):
 
     This calculator only operates on Plans.
     """
+
+    __slots__ = ()
+
     def compute(self, **kwargs):
         """
         Determine if all the districts in a plan fall within a target
@@ -1737,6 +2291,9 @@ class MajorityMinority(CalculatorBase):
 
     This calculator works on plans only.
     """
+
+    __slots__ = ()
+
     def compute(self, **kwargs):
         """
         Determine if the requisite number of districts in a plan have a 
@@ -1769,6 +2326,8 @@ class MajorityMinority(CalculatorBase):
         else:
             apply_num_members = False
 
+        minority_args = self.get_value_args(prefix='minority')
+
         districtcount = 0
         for district in districts:
             pop = self.get_value('population', district)
@@ -1777,11 +2336,9 @@ class MajorityMinority(CalculatorBase):
                 continue
 
             den = float(pop)
-            argnum = 1
             exceeds = False
-            while ('minority%d'%argnum) in self.arg_dict:
-                minor = self.get_value('minority%d'%argnum, district)
-                argnum += 1
+            for (argtype, argval) in minority_args:
+                minor = self.resolve_value(argtype, argval, district)
 
                 if minor is None:
                     continue
@@ -1825,6 +2382,9 @@ class MultiMember(CalculatorBase):
     All multi-member parameters are pulled from the plan's legislative
     body.
     """
+
+    __slots__ = ()
+
     def compute(self, **kwargs):
         """
         Verify that multi-member plans satisfy all parameters.
@@ -1895,6 +2455,9 @@ class Average(CalculatorBase):
     is a positive integer. The summation will add all arguments, starting
     at position 1, until an argument is not found.
     """
+
+    __slots__ = ()
+
     def compute(self, **kwargs):
         """
         Calculate the average of a series of values.
@@ -1916,7 +2479,7 @@ class Average(CalculatorBase):
             if len(filtered) == 0:
                 return
 
-            reduced = reduce(lambda x,y: x+y, filtered)
+            reduced = _fast_sum(filtered)
 
             self.result = { 'value': reduced / len(filtered) }
 
@@ -1931,6 +2494,8 @@ class Average(CalculatorBase):
             return
 
         if not 'list' in kwargs:
+            value_args = self.get_value_args()
+
             total = 0.0
             count = 0.0
             for district in districts:
@@ -1939,16 +2504,13 @@ class Average(CalculatorBase):
                     continue
 
                 count += 1
-                argnum = 0
                 argsum = 0.0
-                while ('value%d' % (argnum+1,)) in self.arg_dict:
-                    argnum += 1
-
-                    number = self.get_value('value%d'%argnum, district)
+                for (argtype, argval) in value_args:
+                    number = self.resolve_value(argtype, argval, district)
                     if not number is None:
                         argsum += float(number)
 
-                total += argsum / argnum
+                total += argsum / len(value_args)
 
             if count == 0:
                 self.result = None
@@ -1985,6 +2547,9 @@ class Comments(CalculatorBase):
 
     This calculator only accepts districts.
     """
+
+    __slots__ = ()
+
     def compute(self, **kwargs):
         """
         Get the related comments and tags, and store them in a dict for
@@ -2027,6 +2592,9 @@ class CommunityTypeCounter(CalculatorBase):
 
     This calculator will only operate on a district.
     """
+
+    __slots__ = ()
+
     def compute(self, **kwargs):
         """
         Count the number of community types which intersect a district.
@@ -2067,6 +2635,9 @@ class CommunityTypeCompatible(CalculatorBase):
 
     This calculator will only operate on a plan.
     """
+
+    __slots__ = ()
+
     def compute(self, **kwargs):
         """
         Evaluate a L{Plan} to determine if it is type-compatible. A L{Plan}
@@ -2144,6 +2715,9 @@ class SplitCounter(CalculatorBase):
     the plan in the keyword args to the plan/geolevel given in the 
     boundary_id.
     """
+
+    __slots__ = ()
+
     def compute(self, **kwargs):
         """
         Calculate splits between a plan and a target layer.
@@ -2229,6 +2803,9 @@ class DistrictSplitCounter(CalculatorBase):
     This calculator accepts a "geolevel_id" argument, which is the id of 
     the geolevel in which to perform the split comparison.
     """
+
+    __slots__ = ()
+
     def compute(self, **kwargs):
         """
         Calculate splits between a district and a target geolevel.
@@ -2255,6 +2832,9 @@ class ConvexHullRatio(CalculatorBase):
     This calculator will either calculate a single district's convex hull ratio,
     or the average convex hull ratio of all districts.
     """
+
+    __slots__ = ()
+
     def compute(self, **kwargs):
         """
         Calculate the convex hull ratio of a district or a plan.
@@ -2283,10 +2863,14 @@ class ConvexHullRatio(CalculatorBase):
         num = 0
         ratios = 0.0
         for district in districts:
-            if district.geom.empty or district.geom.length == 0 or district.district_id == 0:
+            if district.district_id == 0 or district.geom.empty:
                 continue
 
-            ratios += district.geom.area / district.geom.convex_hull.area
+            (area, length) = district.get_geom_metrics()
+            if length == 0:
+                continue
+
+            ratios += area / district.geom.convex_hull.area
             num += 1
 
         self.result = { 'value': (ratios / num) if num > 0 else 0 }
@@ -2310,6 +2894,8 @@ class Adjacency(CalculatorBase):
     travel time.
     """
 
+    __slots__ = ('r',)
+
     def _district_calculator(self, district):
         def sum_query(query):
             return sum(map(lambda x: float(x) if x else 0, self.r.mget(query)))
@@ -2408,7 +2994,7 @@ class Adjacency(CalculatorBase):
         @return: A number formatted similar to "10.01"
         """
         if not self.result is None and 'value' in self.result:
-            t = Template('{{ result_value|floatformat:2 }}')
+            t = get_template('{{ result_value|floatformat:2 }}')
             c = Context({'result_value': self.result['value']})
             return t.render(c)
         else:
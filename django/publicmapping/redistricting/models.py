@@ -2706,9 +2706,28 @@ class District(models.Model):
         return changed
 
 
+    def get_geom_metrics(self):
+        """
+        Get the area and boundary length of this district's geometry.
+
+        Every geometry property access crosses into GEOS and recomputes
+        the quantity from scratch. Several compactness calculators read
+        the same two values for the same district during a scoring pass,
+        so they are computed once and memoized on the district instance.
+
+        Returns:
+            A (area, length) tuple for this district's geometry.
+        """
+        metrics = getattr(self, '_geom_metrics', None)
+        if metrics is None:
+            metrics = (self.geom.area, self.geom.length,)
+            self._geom_metrics = metrics
+
+        return metrics
+
     def clone_relations_from(self, origin):
         """
-        Copy the computed characteristics, comments, and tags from one 
+        Copy the computed characteristics, comments, and tags from one
         district to another.
 
         Cloning District Characteristics, Comments and Tags are required when 
@@ -3310,11 +3329,15 @@ class ScoreFunction(BaseModel):
 
             # Ask the calculator instance to compute the result
             calc.compute(**kwargs)
-
-            # Format the result
-            fl = format.lower()
-            r = calc.html() if fl == 'html' else (calc.json() if fl == 'json' else calc.result)
-            results.append(r)
+            results.append(calc.result)
+
+        # Format all of the results in a single pass, rather than
+        # rendering each one as it is computed
+        fl = format.lower()
+        if fl == 'html':
+            results = calc.html_batch(results)
+        elif fl == 'json':
+            results = calc.json_batch(results)
 
         return results if is_list else results[0]
 
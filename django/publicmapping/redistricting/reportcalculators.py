@@ -40,6 +40,8 @@ class Population(CalculatorBase):
     the optional values are specified, the population of the district will
     be marked within range if it falls between them.
     """
+
+    __slots__ = ()
     def compute(self, **kwargs):
         district = kwargs['district']
 
@@ -72,6 +74,8 @@ class Compactness(CalculatorBase):
     compactness calculation will be performed. Currently available comptypes
     are: 'LengthWidth', 'Roeck', and 'Schwartzberg'
     """
+
+    __slots__ = ()
     def compute(self, **kwargs):
         district = kwargs['district']
         comptype = self.arg_dict['comptype'][1]
@@ -104,6 +108,8 @@ class Majority(CalculatorBase):
     arguments: "value", and "total". If the ratio of the value to the total
     exceeds 50%, it is marked as a majority.
     """
+
+    __slots__ = ()
     def compute(self, **kwargs):
         district = kwargs['district']
 
@@ -129,6 +135,8 @@ class Unassigned(CalculatorBase):
     This calculator only operates on plans. It finds all of the unassigned base
     geounits, lists them by their portable_id, and tallys them up.
     """
+
+    __slots__ = ()
     def compute(self, **kwargs):
         plan = kwargs['plan']
         version = kwargs['version'] if 'version' in kwargs else plan.version            